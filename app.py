@@ -1,5 +1,9 @@
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import streamlit as st
 import numpy as np
+import numba
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -9,39 +13,115 @@ from plotly.subplots import make_subplots
 
 # Import functions from financial_simulation module
 from financial_simulation_lib import (
-    calculate_monthly_return,
+    calculate_monthly_rate,
     get_15_year_sequences,
     run_investment_simulation,
-    extract_simulation_data,
+    summarize_results,
+    month_column,
+    investment_totals,
     calculate_all_irrs,
-    calculate_milestone_statistics,
+    calculate_sequence_statistics,
     calculate_fund_returns,
     market_returns
 )
 
-def get_contribution_for_month(month, contribution_periods):
+def build_contribution_schedule(contribution_periods, total_months=180):
     """
-    Get the contribution amount for a given month based on contribution periods.
+    Build the contribution amount for every month based on contribution periods.
     
     Parameters:
     -----------
-    month : int
-        The month number (0-indexed)
     contribution_periods : list
-        List of dicts with 'contribution' and 'start_month'
+        List of dicts with 'contribution' and 'start_month', sorted by start_month
+    total_months : int
+        Number of simulated months (the schedule covers months 0..total_months)
     
     Returns:
     --------
-    float : The contribution amount for that month
+    np.ndarray : Contribution amount indexed by month number (0-indexed)
     """
-    # Find the appropriate period (last period whose start_month <= month)
-    applicable_contribution = contribution_periods[0]['contribution']
+    # Each period applies from its start_month until a later period takes over
+    schedule = np.full(total_months + 1, contribution_periods[0]['contribution'], dtype=np.float64)
     for period in contribution_periods:
-        if month >= period['start_month']:
-            applicable_contribution = period['contribution']
-        else:
-            break
-    return applicable_contribution
+        schedule[period['start_month']:] = period['contribution']
+    return schedule
+
+def build_sequence_tables(data, complete_sequences, n_rows=3):
+    """
+    Build the best and worst historical sequence tables for one portfolio.
+    
+    Sequences are ranked by median final value.
+    
+    Returns:
+    --------
+    tuple : (best_df, worst_df) numeric DataFrames of n_rows sequences each
+    """
+    seq_stats = calculate_sequence_statistics(data, len(complete_sequences))
+    
+    # Rank by median final value (not average); only the n_rows extremes need ordering
+    median_final = seq_stats['median_final']
+    k = min(n_rows, len(median_final))
+    best = np.argpartition(-median_final, k - 1)[:k]
+    best = best[np.argsort(-median_final[best], kind='stable')]
+    worst = np.argpartition(median_final, k - 1)[:k]
+    worst = worst[np.argsort(-median_final[worst], kind='stable')]
+    
+    def sequence_table(rows):
+        periods = [f"{complete_sequences[seq_idx]['start_year']}-{complete_sequences[seq_idx]['end_year']}"
+                   for seq_idx in seq_stats['sequence'][rows]]
+        baseline = seq_stats['avg_baseline'][rows]
+        median = median_final[rows]
+        return pd.DataFrame({
+            'Period': periods,
+            'Baseline': baseline,
+            'Median Final': median,
+            '10th %ile': seq_stats['p10'][rows],
+            '90th %ile': seq_stats['p90'][rows],
+            'vs Baseline': median - baseline,
+            'Beat %': seq_stats['beat_baseline_pct'][rows]
+        })
+    
+    return sequence_table(best), sequence_table(worst)
+
+def sequence_table_html(df):
+    """
+    Render a sequence table as a static HTML table (no interactive grid needed for 3 rows).
+    """
+    return (df.style
+            .format(SEQUENCE_TABLE_FORMAT)
+            .hide(axis='index')
+            .set_table_attributes('class="perf-table"')
+            .to_html())
+
+@st.cache_data(show_spinner=False)
+def load_complete_sequences():
+    """
+    Get all 15-year historical sequences with data for every asset.
+    
+    The market data never changes, so this is computed once per process.
+    """
+    sequences = get_15_year_sequences(market_returns)
+    return [seq for seq in sequences
+            if seq['SP500'] is not None
+            and seq['NASDAQ100'] is not None
+            and seq['TBILL_3M'] is not None]
+
+# Years at which portfolio values are compared
+MILESTONE_YEARS = [3, 5, 7, 10, 15]
+MILESTONE_PERCENTILES = [10, 25, 50, 75, 90]
+
+# Chart colors, one per portfolio
+PORTFOLIO_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']
+
+# Display formats for the best/worst sequence tables
+SEQUENCE_TABLE_FORMAT = {
+    'Baseline': '${:,.0f}',
+    'Median Final': '${:,.0f}',
+    '10th %ile': '${:,.0f}',
+    '90th %ile': '${:,.0f}',
+    'vs Baseline': '+${:,.0f}',
+    'Beat %': '{:.1f}%'
+}
 
 # Page configuration
 st.set_page_config(
@@ -81,6 +161,19 @@ st.markdown("""
         border-radius: 0.5rem;
         margin: 0.5rem 0;
     }
+    .perf-table {
+        width: 100%;
+        border-collapse: collapse;
+        margin-bottom: 1rem;
+    }
+    .perf-table th, .perf-table td {
+        padding: 0.4rem 0.75rem;
+        border-bottom: 1px solid #e6e9ef;
+        text-align: right;
+    }
+    .perf-table th:first-child, .perf-table td:first-child {
+        text-align: left;
+    }
     </style>
 """, unsafe_allow_html=True)
 
@@ -324,13 +417,20 @@ for i in range(1, 5):
                 st.session_state.portfolios[i]['rebalance_threshold'] = rebalance_threshold
             else:
                 st.session_state.portfolios[i]['rebalance_threshold'] = 5  # Default
-            
-            # Validate allocation
-            total = sp500 + nasdaq + tbill + hysa
-            if total == 100:
-                st.success(f"✓ Total: {total}%")
+
+# Validate all allocations at once (one row per portfolio)
+allocations = np.array([[st.session_state.portfolios[i][asset] for asset in ['SP500', 'NASDAQ', 'TBill', 'HYSA']]
+                        for i in range(1, 5)], dtype=np.int16)
+allocation_totals = allocations.sum(axis=1)
+valid_allocations = allocation_totals == 100
+
+for i in range(1, 5):
+    if st.session_state.portfolios[i]['enabled']:
+        with portfolio_cols[i-1]:
+            if valid_allocations[i-1]:
+                st.success(f"✓ Total: {allocation_totals[i-1]}%")
             else:
-                st.error(f"⚠ Total: {total}% (must equal 100%)")
+                st.error(f"⚠ Total: {allocation_totals[i-1]}% (must equal 100%)")
 
 # Run simulation button
 st.markdown("---")
@@ -342,7 +442,13 @@ with col2:
         if 'simulation_results' in st.session_state:
             del st.session_state.simulation_results
             del st.session_state.complete_sequences
-            del st.session_state.contribution_func
+            del st.session_state.contribution_schedule
+            del st.session_state.hysa_monthly_return
+            del st.session_state.milestone_stats
+            del st.session_state.milestone_percentiles
+            del st.session_state.sequence_tables
+            del st.session_state.irr_results
+            del st.session_state.allocation_charts
             st.success("Results cleared!")
             st.rerun()
 
@@ -355,139 +461,116 @@ if run_simulation:
     else:
         all_valid = True
         for i in enabled_portfolios:
-            port = st.session_state.portfolios[i]
-            total = port['SP500'] + port['NASDAQ'] + port['TBill'] + port['HYSA']
-            if total != 100:
-                st.error(f"Portfolio {i} ({port['name']}) allocation must total 100% (currently {total}%)")
+            if not valid_allocations[i-1]:
+                port = st.session_state.portfolios[i]
+                st.error(f"Portfolio {i} ({port['name']}) allocation must total 100% (currently {allocation_totals[i-1]}%)")
                 all_valid = False
         
         if all_valid:
             # Get historical sequences
             with st.spinner("Loading historical market data..."):
-                sequences = get_15_year_sequences(market_returns)
-                complete_sequences = [seq for seq in sequences
-                                    if seq['SP500'] is not None
-                                    and seq['NASDAQ100'] is not None
-                                    and seq['TBILL_3M'] is not None]
+                complete_sequences = load_complete_sequences()
                 
                 st.info(f"Found {len(complete_sequences)} complete 15-year historical sequences")
             
-            # Create contribution function
-            def contribution_func(month):
-                return get_contribution_for_month(month, contribution_periods)
+            # Create contribution function (O(1) lookup into the precomputed schedule)
+            contrib_schedule = build_contribution_schedule(contribution_periods)
             
-            # Store results
-            simulation_results = {}
-            
-            # Run simulations for each enabled portfolio
+            # Build one simulation job per enabled portfolio
+            jobs = {}
             for i in enabled_portfolios:
                 port = st.session_state.portfolios[i]
-                
-                with st.spinner(f"Running simulation for {port['name']}..."):
-                    investment_mix = {
-                        'SP500': port['SP500'] / 100,
-                        'NASDAQ': port['NASDAQ'] / 100,
-                        'TBill': port['TBill'] / 100,
-                        'HYSA': port['HYSA'] / 100
-                    }
-                    
-                    results = run_investment_simulation(
-                        investment_mix=investment_mix,
-                        investment_start=investment_start,
-                        emergency_fund_start=emergency_fund_start,
-                        complete_sequences=complete_sequences,
-                        total_iterations=total_iterations,
-                        hysa_apy=hysa_apy,
-                        SP500_std=SP500_std,
-                        NASDAQ_std=NASDAQ_std,
-                        T_Bills_std=T_Bills_std,
-                        contribution_function=contribution_func,
-                        enable_rebalancing=port['rebalance'],
-                        rebalancing_threshold=port.get('rebalance_threshold', 5) / 100,  # Convert to decimal
-                        simulation_name=port['name']
-                    )
-                    
-                    simulation_results[i] = {
-                        'name': port['name'],
-                        'results': results,
-                        'data': extract_simulation_data(results),
-                        'investment_mix': investment_mix
-                    }
+                investment_mix = {
+                    'SP500': port['SP500'] / 100,
+                    'NASDAQ': port['NASDAQ'] / 100,
+                    'TBill': port['TBill'] / 100,
+                    'HYSA': port['HYSA'] / 100
+                }
+                jobs[i] = dict(
+                    investment_mix=investment_mix,
+                    investment_start=investment_start,
+                    emergency_fund_start=emergency_fund_start,
+                    complete_sequences=complete_sequences,
+                    total_iterations=total_iterations,
+                    hysa_apy=hysa_apy,
+                    SP500_std=SP500_std,
+                    NASDAQ_std=NASDAQ_std,
+                    T_Bills_std=T_Bills_std,
+                    contribution_function=contrib_schedule,
+                    enable_rebalancing=port['rebalance'],
+                    rebalancing_threshold=port.get('rebalance_threshold', 5) / 100,  # Convert to decimal
+                    simulation_name=port['name'],
+                    # Monthly paths are only kept for the allocation over time graphs
+                    return_trajectories=not memory_efficient
+                )
+            
+            # Give every portfolio its own independent random stream
+            for job, seed in zip(jobs.values(), np.random.SeedSequence().spawn(len(jobs))):
+                job['seed'] = seed
+            
+            # Run the independent portfolio simulations in parallel worker processes.
+            # Each worker's Numba kernel is itself parallel, so the cores are split
+            # between the workers instead of every worker starting one thread per core.
+            with st.spinner(f"Running simulations for {len(jobs)} portfolio(s)..."):
+                max_workers = min(len(jobs), os.cpu_count() or 1)
+                threads_per_worker = min(max(1, (os.cpu_count() or 1) // max_workers),
+                                         numba.config.NUMBA_NUM_THREADS)
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=numba.set_num_threads,
+                                         initargs=(threads_per_worker,)) as executor:
+                    futures = {executor.submit(run_investment_simulation, **kwargs): i for i, kwargs in jobs.items()}
+                    portfolio_results = {futures[future]: future.result() for future in as_completed(futures)}
+            
+            # Store results (in portfolio order, the first one supplies the baseline).
+            # Each portfolio's data holds views into its own float32 path block, so
+            # the asset series are never copied.
+            simulation_results = {}
+            for i in enabled_portfolios:
+                results = portfolio_results[i]
+                simulation_results[i] = {
+                    'name': st.session_state.portfolios[i]['name'],
+                    'results': results,
+                    'data': summarize_results(results, MILESTONE_YEARS),
+                    'investment_mix': jobs[i]['investment_mix']
+                }
+            
+            # Precompute milestone statistics so chart/table redraws only read them
+            milestone_columns = month_column(portfolio_results[enabled_portfolios[0]],
+                                             [year * 12 for year in MILESTONE_YEARS])
+            milestone_stats = {}
+            milestone_percentiles = {}
+            for pid, result_data in simulation_results.items():
+                for year in MILESTONE_YEARS:
+                    milestone_stats[(pid, year)] = result_data['data']['milestones'][year]
+                milestone_values = result_data['data']['totals'][:, milestone_columns]
+                milestone_percentiles[pid] = np.percentile(milestone_values, MILESTONE_PERCENTILES, axis=0)
+            
+            # Best/worst sequence tables only depend on this run's results; pre-render them as HTML
+            sequence_tables = {
+                pid: tuple(sequence_table_html(df) for df in build_sequence_tables(result_data['data'], complete_sequences))
+                for pid, result_data in simulation_results.items()
+            }
             
             # Store in session state
             st.session_state.simulation_results = simulation_results
+            st.session_state.milestone_stats = milestone_stats
+            st.session_state.milestone_percentiles = milestone_percentiles
+            st.session_state.sequence_tables = sequence_tables
+            # IRRs are solved lazily by the statistics tabs and kept for the run
+            st.session_state.irr_results = {}
+            st.session_state.allocation_charts = {}
             st.session_state.complete_sequences = complete_sequences
-            st.session_state.contribution_func = contribution_func
+            # Inputs the IRR calculation needs, fixed to this run's settings
+            st.session_state.contribution_schedule = contrib_schedule
+            st.session_state.hysa_monthly_return = calculate_monthly_rate(hysa_apy)
             st.session_state.memory_efficient = memory_efficient
             st.success("✓ Simulation complete!")
 
-# Display results if available
-if 'simulation_results' in st.session_state:
-    results = st.session_state.simulation_results
-    complete_sequences = st.session_state.complete_sequences
-    contribution_func = st.session_state.contribution_func
-    
-    st.markdown("---")
-    st.markdown('<p class="section-header">📈 Simulation Results</p>', unsafe_allow_html=True)
-    
-    # Summary metrics
-    st.markdown("### Final Portfolio Values (15 Years)")
-    
-    # Add baseline column first, then portfolio columns
-    baseline_mean = np.mean(list(results.values())[0]['data']['baselines'])
-    
-    num_cols = len(results) + 1  # +1 for baseline
-    metric_cols = st.columns(num_cols)
-    
-    # Baseline in first column
-    with metric_cols[0]:
-        st.metric(
-            label="Baseline (HYSA)",
-            value=f"${baseline_mean:,.0f}",
-            delta=None
-        )
-    
-    # Portfolios in remaining columns
-    for idx, (port_id, result_data) in enumerate(results.items(), 1):
-        with metric_cols[idx]:
-            data = result_data['data']
-            final_values = data['final_values']
-            baselines = data['baselines']
-            
-            median_value = np.median(final_values)
-            beat_baseline_pct = np.sum(final_values > baselines) / len(final_values) * 100
-            
-            st.metric(
-                label=result_data['name'],
-                value=f"${median_value:,.0f}",
-                delta=f"{beat_baseline_pct:.1f}% beat baseline"
-            )
-    
-    # Create comparison table
-    st.markdown("### Detailed Comparison")
-    
-    comparison_data = []
-    for port_id, result_data in results.items():
-        data = result_data['data']
-        final_values = data['final_values']
-        baselines = data['baselines']
-        
-        comparison_data.append({
-            'Portfolio': result_data['name'],
-            'Mean': f"${np.mean(final_values):,.0f}",
-            'Median': f"${np.median(final_values):,.0f}",
-            '25th %ile': f"${np.percentile(final_values, 25):,.0f}",
-            '75th %ile': f"${np.percentile(final_values, 75):,.0f}",
-            'Std Dev': f"${np.std(final_values):,.0f}",
-            'Beat Baseline': f"{np.sum(final_values > baselines) / len(final_values) * 100:.1f}%"
-        })
-    
-    df_comparison = pd.DataFrame(comparison_data)
-    st.dataframe(df_comparison, use_container_width=True)
-    
-    # Milestone comparison with percentiles
-    st.markdown("### Portfolio Growth Over Time")
-    
+# Results display sections (fragments rerun on their own widget changes)
+@st.fragment
+def render_growth_chart(results, milestone_stats, milestone_percentiles):
+    """
+    Render the milestone growth chart; its filter checkboxes only rerun this fragment.
+    """
     # Controls for filtering the chart
     st.markdown("**Chart Filters:**")
     filter_col1, filter_col2 = st.columns(2)
@@ -511,56 +594,27 @@ if 'simulation_results' in st.session_state:
         show_p90 = st.checkbox("90th Percentile", value=False, key="show_p90")
         show_baseline = st.checkbox("Baseline", value=True, key="show_baseline")
     
-    # Build milestone data
-    milestones = [3, 5, 7, 10, 15]
     
-    # Create interactive plot with Plotly
-    fig = go.Figure()
+    milestones = MILESTONE_YEARS
+    baseline_port_id = next(iter(results))
     
-    colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728']
+    # Collect traces first and build the Plotly figure once
+    traces = []
     
     # Add traces for each selected portfolio and percentile
     for idx, (port_id, result_data) in enumerate(results.items()):
         if not portfolio_filters.get(port_id, False):
             continue
             
-        color = colors[idx % len(colors)]
+        color = PORTFOLIO_COLORS[idx % len(PORTFOLIO_COLORS)]
         name = result_data['name']
         
-        # Calculate percentiles at each milestone
-        percentile_data = {
-            'p10': [],
-            'p25': [],
-            'p50': [],
-            'p75': [],
-            'p90': []
-        }
-        
-        for year in milestones:
-            stats = calculate_milestone_statistics(result_data['results'], year)
-            month_index = year * 12
-            
-            # Calculate all percentiles
-            milestone_values = []
-            for result_dict in result_data['results']['result_dict']:
-                if len(result_dict['Month_Index']) > month_index:
-                    total = (result_dict['SP500'][month_index] +
-                            result_dict['NASDAQ100'][month_index] +
-                            result_dict['TBILL_3M'][month_index] +
-                            result_dict['HYSA'][month_index] +
-                            result_dict['Emergency_fund'][month_index])
-                    milestone_values.append(total)
-            
-            milestone_values = np.array(milestone_values)
-            percentile_data['p10'].append(np.percentile(milestone_values, 10))
-            percentile_data['p25'].append(np.percentile(milestone_values, 25))
-            percentile_data['p50'].append(np.percentile(milestone_values, 50))
-            percentile_data['p75'].append(np.percentile(milestone_values, 75))
-            percentile_data['p90'].append(np.percentile(milestone_values, 90))
+        # Percentiles at each milestone, precomputed after the simulation
+        percentile_data = dict(zip(['p10', 'p25', 'p50', 'p75', 'p90'], milestone_percentiles[port_id]))
         
         # Add selected percentile traces
         if show_p10:
-            fig.add_trace(go.Scatter(
+            traces.append(go.Scatter(
                 x=milestones,
                 y=percentile_data['p10'],
                 mode='lines+markers',
@@ -571,7 +625,7 @@ if 'simulation_results' in st.session_state:
             ))
         
         if show_p25:
-            fig.add_trace(go.Scatter(
+            traces.append(go.Scatter(
                 x=milestones,
                 y=percentile_data['p25'],
                 mode='lines+markers',
@@ -582,7 +636,7 @@ if 'simulation_results' in st.session_state:
             ))
         
         if show_median:
-            fig.add_trace(go.Scatter(
+            traces.append(go.Scatter(
                 x=milestones,
                 y=percentile_data['p50'],
                 mode='lines+markers',
@@ -593,7 +647,7 @@ if 'simulation_results' in st.session_state:
             ))
         
         if show_p75:
-            fig.add_trace(go.Scatter(
+            traces.append(go.Scatter(
                 x=milestones,
                 y=percentile_data['p75'],
                 mode='lines+markers',
@@ -604,7 +658,7 @@ if 'simulation_results' in st.session_state:
             ))
         
         if show_p90:
-            fig.add_trace(go.Scatter(
+            traces.append(go.Scatter(
                 x=milestones,
                 y=percentile_data['p90'],
                 mode='lines+markers',
@@ -616,12 +670,9 @@ if 'simulation_results' in st.session_state:
     
     # Add baseline if selected
     if show_baseline:
-        baseline_values = []
-        for year in milestones:
-            stats = calculate_milestone_statistics(list(results.values())[0]['results'], year)
-            baseline_values.append(stats['avg_baseline'])
+        baseline_values = [milestone_stats[(baseline_port_id, year)]['avg_baseline'] for year in milestones]
         
-        fig.add_trace(go.Scatter(
+        traces.append(go.Scatter(
             x=milestones,
             y=baseline_values,
             mode='lines+markers',
@@ -630,6 +681,8 @@ if 'simulation_results' in st.session_state:
             marker=dict(size=8)
         ))
     
+    fig = go.Figure(data=traces)
+    
     fig.update_layout(
         title='Portfolio Value at Key Milestones (Customizable View)',
         xaxis_title='Years',
@@ -647,70 +700,21 @@ if 'simulation_results' in st.session_state:
     fig.update_yaxes(tickformat='$,.0f')
     
     st.plotly_chart(fig, use_container_width=True)
+
+
+@st.fragment
+def render_distributions(results):
+    """
+    Render the final value distribution tabs.
+    """
+    # Use common bin edges across all portfolios so the distributions are comparable
+    all_final_values = np.concatenate([result_data['data']['final_values'] for result_data in results.values()])
+    bin_edges = np.histogram_bin_edges(all_final_values, bins=35)
+    xbins = dict(start=bin_edges[0], end=bin_edges[-1], size=bin_edges[1] - bin_edges[0])
     
-    # Percentile Table at Milestones
-    st.markdown("### Percentile Values at Key Milestones")
-    
-    milestones = [3, 5, 7, 10, 15]
-    
-    # Build hierarchical column structure
-    columns = [('Year', '')]
-    columns.append(('Baseline', ''))
-    
-    for port_id, result_data in results.items():
-        for percentile_name in ['10th', '25th', '50th', '75th', '90th']:
-            columns.append((result_data['name'], f"{percentile_name}%"))
-    
-    # Create multi-index columns
-    multi_columns = pd.MultiIndex.from_tuples(columns)
-    
-    # Build data rows
-    table_data = []
-    for year in milestones:
-        row_data = [year]
-        
-        # Add baseline
-        stats = calculate_milestone_statistics(list(results.values())[0]['results'], year)
-        row_data.append(f"${stats['avg_baseline']:,.0f}")
-        
-        # Add each portfolio's percentiles
-        for port_id, result_data in results.items():
-            month_index = year * 12
-            milestone_values = []
-            
-            for result_dict in result_data['results']['result_dict']:
-                if len(result_dict['Month_Index']) > month_index:
-                    total = (result_dict['SP500'][month_index] +
-                            result_dict['NASDAQ100'][month_index] +
-                            result_dict['TBILL_3M'][month_index] +
-                            result_dict['HYSA'][month_index] +
-                            result_dict['Emergency_fund'][month_index])
-                    milestone_values.append(total)
-            
-            if milestone_values:
-                for percentile_value in [10, 25, 50, 75, 90]:
-                    row_data.append(f"${np.percentile(milestone_values, percentile_value):,.0f}")
-            else:
-                for _ in range(5):
-                    row_data.append("N/A")
-        
-        table_data.append(row_data)
-    
-    # Create DataFrame with hierarchical columns
-    df_milestones = pd.DataFrame(table_data, columns=multi_columns)
-    st.dataframe(df_milestones, use_container_width=True, hide_index=True)
-    
-    # Distribution comparison (tabs instead of overlay)
-    st.markdown("### Final Value Distributions")
-    
-    # First, calculate the max frequency across all portfolios for consistent y-axis
-    all_final_values = []
-    for port_id, result_data in results.items():
-        all_final_values.extend(result_data['data']['final_values'])
-    
-    # Calculate histogram to get max frequency
-    hist_counts, _ = np.histogram(all_final_values, bins=35)
-    max_frequency = int(np.max(hist_counts) * 1.1)  # Add 10% padding
+    # Max frequency across all portfolios (on the shared bins) for a consistent y-axis
+    max_frequency = int(max(np.histogram(result_data['data']['final_values'], bins=bin_edges)[0].max()
+                            for result_data in results.values()) * 1.1)  # Add 10% padding
     
     # Create tabs for each portfolio
     dist_tabs = st.tabs([result_data['name'] for result_data in results.values()])
@@ -719,21 +723,19 @@ if 'simulation_results' in st.session_state:
         with tab:
             data = result_data['data']
             final_values = data['final_values']
-            baselines = data['baselines']
+            summary = data['summary']
             
-            fig = go.Figure()
-            
-            # Add portfolio distribution
-            fig.add_trace(go.Histogram(
+            # Portfolio distribution
+            fig = go.Figure(data=[go.Histogram(
                 x=final_values,
                 name=result_data['name'],
-                marker_color=colors[(port_id-1) % len(colors)],
+                marker_color=PORTFOLIO_COLORS[(port_id-1) % len(PORTFOLIO_COLORS)],
                 opacity=0.7,
-                nbinsx=35
-            ))
+                xbins=xbins
+            )])
             
             # Add median line only (removed baseline)
-            median_val = np.median(final_values)
+            median_val = summary['median']
             fig.add_vline(
                 x=median_val,
                 line_dash="dot",
@@ -756,151 +758,297 @@ if 'simulation_results' in st.session_state:
             st.plotly_chart(fig, use_container_width=True)
             
             # Show summary statistics with baseline first, then all percentiles including median
-            baseline_mean = np.mean(baselines)
             col0, col1, col2, col3, col4, col5 = st.columns(6)
             with col0:
-                st.metric("Baseline", f"${baseline_mean:,.0f}")
+                st.metric("Baseline", f"${summary['avg_baseline']:,.0f}")
             with col1:
-                st.metric("10th %ile", f"${np.percentile(final_values, 10):,.0f}")
+                st.metric("10th %ile", f"${summary['p10']:,.0f}")
             with col2:
-                st.metric("25th %ile", f"${np.percentile(final_values, 25):,.0f}")
+                st.metric("25th %ile", f"${summary['p25']:,.0f}")
             with col3:
-                st.metric("50th %ile (Median)", f"${np.percentile(final_values, 50):,.0f}")
+                st.metric("50th %ile (Median)", f"${summary['p50']:,.0f}")
             with col4:
-                st.metric("75th %ile", f"${np.percentile(final_values, 75):,.0f}")
+                st.metric("75th %ile", f"${summary['p75']:,.0f}")
             with col5:
-                st.metric("90th %ile", f"${np.percentile(final_values, 90):,.0f}")
+                st.metric("90th %ile", f"${summary['p90']:,.0f}")
+
+
+def build_allocation_chart(result_data):
+    """
+    Build the median allocation chart and target vs final table for one portfolio.
     
-    # Asset Allocation Over Time (skip if memory efficient mode)
-    if not st.session_state.get('memory_efficient', False):
-        st.markdown("### Asset Allocation Over Time")
-    st.markdown("**Track how portfolio allocation changes over the 15-year period**")
+    Returns:
+    --------
+    tuple : (fig, alloc_table) Plotly figure and styled allocation table
+    """
+    # Calculate median allocations at each month
+    months = result_data['results']['month_index']  # 0 to 180 months (15 years)
+    
+    asset_values = result_data['data']['asset_values']
+    invested_total = investment_totals(result_data['data'])
+    
+    # Allocation % per iteration and month; months with no invested value are skipped
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        sp500_allocs, nasdaq_allocs, tbill_allocs, hysa_allocs = (
+            np.nanmedian(np.where(invested_total > 0, asset_values[asset] / invested_total * 100, np.nan), axis=0)
+            for asset in ['SP500', 'NASDAQ100', 'TBILL_3M', 'HYSA']
+        )
+    
+    # Convert months to years for x-axis
+    years_axis = [m / 12 for m in months]
+    
+    # Create the allocation chart from one stacked trace per asset
+    alloc_series = [
+        ('S&P 500', '#1f77b4', sp500_allocs),
+        ('NASDAQ 100', '#ff7f0e', nasdaq_allocs),
+        ('3-Month T-Bills', '#2ca02c', tbill_allocs),
+        ('HYSA', '#d62728', hysa_allocs),
+    ]
+    fig = go.Figure(data=[
+        go.Scatter(
+            x=years_axis,
+            y=allocs,
+            mode='lines',
+            name=name,
+            line=dict(color=color, width=2),
+            stackgroup='one'
+        )
+        for name, color, allocs in alloc_series
+    ])
+    
+    # Add target allocation line (dashed); a layout shape rather than a trace
+    target_mix = result_data['investment_mix']
+    fig.add_hline(
+        y=target_mix['SP500']*100,
+        line=dict(color='#1f77b4', width=1, dash='dash')
+    )
+    
+    fig.update_layout(
+        title=f'{result_data["name"]} - Median Asset Allocation Over Time',
+        xaxis_title='Years',
+        yaxis_title='Allocation (%)',
+        hovermode='x unified',
+        height=500,
+        yaxis=dict(range=[0, 100])
+    )
+    
+    # Target vs median final allocation table, formatted once with the chart
+    alloc_df = pd.DataFrame({
+        'Target Allocation (%)': np.array([target_mix[key] for key in ['SP500', 'NASDAQ', 'TBill', 'HYSA']]) * 100,
+        'Median Final Allocation, Year 15 (%)': [allocs[-1] for _, _, allocs in alloc_series]
+    }, index=['S&P 500', 'NASDAQ 100', 'T-Bills', 'HYSA'])
+    
+    return fig, alloc_df.style.format('{:.1f}%')
+
+
+@st.fragment
+def render_allocation_over_time(results):
+    """
+    Render the median asset allocation over time tabs.
+    """
+    # Allocations only change with a new run, so each chart is built once and reused
+    allocation_charts = st.session_state.allocation_charts
     
     # Create tabs for each portfolio
     alloc_tabs = st.tabs([result_data['name'] for result_data in results.values()])
     
     for tab, (port_id, result_data) in zip(alloc_tabs, results.items()):
         with tab:
-            # Calculate median allocations at each month
-            months = list(range(0, 181, 1))  # 0 to 180 months (15 years)
+            if port_id not in allocation_charts:
+                allocation_charts[port_id] = build_allocation_chart(result_data)
+            fig, alloc_table = allocation_charts[port_id]
             
-            # Initialize allocation tracking
-            sp500_allocs = []
-            nasdaq_allocs = []
-            tbill_allocs = []
-            hysa_allocs = []
-            
-            for month_idx in months:
-                month_sp500 = []
-                month_nasdaq = []
-                month_tbill = []
-                month_hysa = []
-                
-                # Get allocation at this month for all iterations
-                for result_dict in result_data['results']['result_dict']:
-                    if month_idx < len(result_dict['Month_Index']):
-                        total = (result_dict['SP500'][month_idx] +
-                                result_dict['NASDAQ100'][month_idx] +
-                                result_dict['TBILL_3M'][month_idx] +
-                                result_dict['HYSA'][month_idx])
-                        
-                        if total > 0:
-                            month_sp500.append(result_dict['SP500'][month_idx] / total * 100)
-                            month_nasdaq.append(result_dict['NASDAQ100'][month_idx] / total * 100)
-                            month_tbill.append(result_dict['TBILL_3M'][month_idx] / total * 100)
-                            month_hysa.append(result_dict['HYSA'][month_idx] / total * 100)
-                
-                # Calculate median allocation for this month
-                if month_sp500:
-                    sp500_allocs.append(np.median(month_sp500))
-                    nasdaq_allocs.append(np.median(month_nasdaq))
-                    tbill_allocs.append(np.median(month_tbill))
-                    hysa_allocs.append(np.median(month_hysa))
-                else:
-                    sp500_allocs.append(None)
-                    nasdaq_allocs.append(None)
-                    tbill_allocs.append(None)
-                    hysa_allocs.append(None)
-            
-            # Convert months to years for x-axis
-            years_axis = [m / 12 for m in months]
-            
-            # Create the allocation chart
-            fig = go.Figure()
-            
-            fig.add_trace(go.Scatter(
-                x=years_axis,
-                y=sp500_allocs,
-                mode='lines',
-                name='S&P 500',
-                line=dict(color='#1f77b4', width=2),
-                stackgroup='one'
-            ))
-            
-            fig.add_trace(go.Scatter(
-                x=years_axis,
-                y=nasdaq_allocs,
-                mode='lines',
-                name='NASDAQ 100',
-                line=dict(color='#ff7f0e', width=2),
-                stackgroup='one'
-            ))
-            
-            fig.add_trace(go.Scatter(
-                x=years_axis,
-                y=tbill_allocs,
-                mode='lines',
-                name='3-Month T-Bills',
-                line=dict(color='#2ca02c', width=2),
-                stackgroup='one'
-            ))
+            st.plotly_chart(fig, use_container_width=True)
+            st.table(alloc_table)
+
+
+def solve_portfolio_irrs(port_id, simulation_results, contribution_schedule, HYSA_monthly_returns):
+    """
+    Solve one portfolio's IRRs and keep them for the current run (button callback).
+    """
+    st.session_state.irr_results[port_id] = calculate_all_irrs(
+        simulation_results,
+        contribution_schedule,
+        HYSA_monthly_returns
+    )
+
+
+@st.fragment
+def render_sequence_analysis(results, sequence_tables):
+    """
+    Render the best and worst historical sequence expanders.
+    """
+    # Analyze sequences for each portfolio
+    for port_id, result_data in results.items():
+        with st.expander(f"{result_data['name']} - Best & Worst Sequences"):
+            best_html, worst_html = sequence_tables[port_id]
             
-            fig.add_trace(go.Scatter(
-                x=years_axis,
-                y=hysa_allocs,
-                mode='lines',
-                name='HYSA',
-                line=dict(color='#d62728', width=2),
-                stackgroup='one'
-            ))
+            # Top 3 performing sequences
+            st.markdown("**Top 3 Best Performing Sequences:**")
+            st.markdown(best_html, unsafe_allow_html=True)
             
-            # Add target allocation lines (dashed)
-            target_mix = result_data['investment_mix']
-            fig.add_trace(go.Scatter(
-                x=[0, 15],
-                y=[target_mix['SP500']*100, target_mix['SP500']*100],
-                mode='lines',
-                name='Target S&P 500',
-                line=dict(color='#1f77b4', width=1, dash='dash'),
-                showlegend=False
-            ))
+            # Bottom 3 performing sequences
+            st.markdown("**Top 3 Worst Performing Sequences:**")
+            st.markdown(worst_html, unsafe_allow_html=True)
+
+
+@st.fragment
+def render_portfolio_statistics(port_id, result_data, contribution_schedule, HYSA_monthly_returns):
+    """
+    Render one portfolio's detailed statistics tab.
+    """
+    data = result_data['data']
+    
+    # IRR is only solved on request (all tabs run on every rerun), then kept for the run
+    irr_results = st.session_state.irr_results
+    if port_id not in irr_results:
+        # Solved in the click callback, so the rerun it triggers already shows the results
+        st.button(
+            "Calculate IRR",
+            key=f"compute_irr_{port_id}",
+            on_click=solve_portfolio_irrs,
+            args=(port_id, result_data['results'], contribution_schedule, HYSA_monthly_returns)
+        )
+    irr_data = irr_results.get(port_id)
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.markdown("**Portfolio Statistics**")
+        if irr_data is not None:
+            st.write(f"Mean IRR: {np.mean(irr_data['irr_returns']):.2f}%")
+            st.write(f"Median IRR: {np.median(irr_data['irr_returns']):.2f}%")
+            st.write(f"Std Dev IRR: {np.std(irr_data['irr_returns']):.2f}%")
+            st.write(f"Min IRR: {np.min(irr_data['irr_returns']):.2f}%")
+            st.write(f"Max IRR: {np.max(irr_data['irr_returns']):.2f}%")
+        else:
+            st.caption("Click \"Calculate IRR\" to compute IRR statistics for this portfolio.")
+    
+    with col2:
+        st.markdown("**Baseline Comparison**")
+        if irr_data is not None:
+            st.write(f"Baseline IRR: {np.mean(irr_data['baseline_irr_returns']):.2f}%")
+            st.write(f"IRR Advantage: {np.mean(irr_data['irr_returns']) - np.mean(irr_data['baseline_irr_returns']):.2f}%")
+        st.write(f"Beat Baseline: {data['summary']['beat_baseline_pct']:.2f}%")
+        st.write(f"Median Gain: ${data['summary']['median_gain']:,.0f}")
+
+
+# Display results if available
+if 'simulation_results' in st.session_state:
+    results = st.session_state.simulation_results
+    # The first portfolio supplies the shared baseline
+    baseline_port_id = next(iter(results))
+    first_result = results[baseline_port_id]
+    complete_sequences = st.session_state.complete_sequences
+    contribution_schedule = st.session_state.contribution_schedule
+    HYSA_monthly_returns = st.session_state.hysa_monthly_return
+    milestone_stats = st.session_state.milestone_stats
+    milestone_percentiles = st.session_state.milestone_percentiles
+    sequence_tables = st.session_state.sequence_tables
+    
+    st.markdown("---")
+    st.markdown('<p class="section-header">📈 Simulation Results</p>', unsafe_allow_html=True)
+    
+    # Summary metrics
+    st.markdown("### Final Portfolio Values (15 Years)")
+    
+    # Add baseline column first, then portfolio columns
+    baseline_mean = first_result['data']['summary']['avg_baseline']
+    
+    num_cols = len(results) + 1  # +1 for baseline
+    metric_cols = st.columns(num_cols)
+    
+    # Baseline in first column
+    with metric_cols[0]:
+        st.metric(
+            label="Baseline (HYSA)",
+            value=f"${baseline_mean:,.0f}",
+            delta=None
+        )
+    
+    # Portfolios in remaining columns
+    for idx, (port_id, result_data) in enumerate(results.items(), 1):
+        with metric_cols[idx]:
+            summary = result_data['data']['summary']
             
-            fig.update_layout(
-                title=f'{result_data["name"]} - Median Asset Allocation Over Time',
-                xaxis_title='Years',
-                yaxis_title='Allocation (%)',
-                hovermode='x unified',
-                height=500,
-                yaxis=dict(range=[0, 100])
+            st.metric(
+                label=result_data['name'],
+                value=f"${summary['median']:,.0f}",
+                delta=f"{summary['beat_baseline_pct']:.1f}% beat baseline"
             )
-            
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Show initial vs final allocation
-            col1, col2 = st.columns(2)
-            with col1:
-                st.markdown("**Target Allocation:**")
-                st.write(f"S&P 500: {target_mix['SP500']*100:.1f}%")
-                st.write(f"NASDAQ 100: {target_mix['NASDAQ']*100:.1f}%")
-                st.write(f"T-Bills: {target_mix['TBill']*100:.1f}%")
-                st.write(f"HYSA: {target_mix['HYSA']*100:.1f}%")
-            
-            with col2:
-                st.markdown("**Median Final Allocation (Year 15):**")
-                st.write(f"S&P 500: {sp500_allocs[-1]:.1f}%")
-                st.write(f"NASDAQ 100: {nasdaq_allocs[-1]:.1f}%")
-                st.write(f"T-Bills: {tbill_allocs[-1]:.1f}%")
-                st.write(f"HYSA: {hysa_allocs[-1]:.1f}%")
+    
+    # Create comparison table
+    st.markdown("### Detailed Comparison")
+    
+    # Keep numeric columns and format them at render time
+    summaries = [result_data['data']['summary'] for result_data in results.values()]
+    df_comparison = pd.DataFrame({
+        'Portfolio': [result_data['name'] for result_data in results.values()],
+        'Mean': np.array([summary['mean'] for summary in summaries]),
+        'Median': np.array([summary['median'] for summary in summaries]),
+        '25th %ile': np.array([summary['p25'] for summary in summaries]),
+        '75th %ile': np.array([summary['p75'] for summary in summaries]),
+        'Std Dev': np.array([summary['std'] for summary in summaries]),
+        'Beat Baseline': np.array([summary['beat_baseline_pct'] for summary in summaries])
+    })
+    st.dataframe(
+        df_comparison.style.format({
+            'Mean': '${:,.0f}',
+            'Median': '${:,.0f}',
+            '25th %ile': '${:,.0f}',
+            '75th %ile': '${:,.0f}',
+            'Std Dev': '${:,.0f}',
+            'Beat Baseline': '{:.1f}%'
+        }),
+        use_container_width=True
+    )
+    
+    # Milestone comparison with percentiles
+    st.markdown("### Portfolio Growth Over Time")
+    
+    render_growth_chart(results, milestone_stats, milestone_percentiles)
+    
+    # Percentile Table at Milestones
+    st.markdown("### Percentile Values at Key Milestones")
+    
+    milestones = MILESTONE_YEARS
+    
+    # Build hierarchical column structure
+    columns = [('Year', '')]
+    columns.append(('Baseline', ''))
+    
+    for port_id, result_data in results.items():
+        for percentile_name in ['10th', '25th', '50th', '75th', '90th']:
+            columns.append((result_data['name'], f"{percentile_name}%"))
+    
+    # Create multi-index columns
+    multi_columns = pd.MultiIndex.from_tuples(columns)
+    
+    # Reuse the percentiles drawn in the chart: one row per milestone, 5 columns per portfolio
+    table_values = np.concatenate([milestone_percentiles[port_id] for port_id in results]).T
+    
+    baseline_values = np.array([milestone_stats[(baseline_port_id, year)]['avg_baseline'] for year in milestones])
+    
+    # Create numeric DataFrame with hierarchical columns
+    df_milestones = pd.DataFrame(np.column_stack([baseline_values, table_values]), columns=multi_columns[1:])
+    df_milestones.insert(0, multi_columns[0], milestones)
+    st.dataframe(
+        df_milestones.style.format('${:,.0f}', subset=list(multi_columns[1:])),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    # Distribution comparison (tabs instead of overlay)
+    st.markdown("### Final Value Distributions")
+    
+    render_distributions(results)
+    
+    # Asset Allocation Over Time (skip if memory efficient mode)
+    if not st.session_state.get('memory_efficient', False):
+        st.markdown("### Asset Allocation Over Time")
+        st.markdown("**Track how portfolio allocation changes over the 15-year period**")
+        render_allocation_over_time(results)
     else:
         st.info("ℹ️ Asset Allocation Over Time graphs disabled in Memory Efficient Mode. Uncheck the option in the sidebar to enable.")
     
@@ -908,107 +1056,16 @@ if 'simulation_results' in st.session_state:
     st.markdown("### Historical Sequence Analysis")
     st.markdown("**Which 15-year historical periods performed best and worst?**")
     
-    # Analyze sequences for each portfolio
-    for port_id, result_data in results.items():
-        with st.expander(f"{result_data['name']} - Best & Worst Sequences"):
-            data = result_data['data']
-            final_values = data['final_values']
-            sequence_indices = data['sequence_indices']
-            baselines = data['baselines']
-            
-            # Calculate average final value for each sequence
-            sequence_performance = {}
-            for seq_idx in range(len(complete_sequences)):
-                seq_mask = sequence_indices == seq_idx
-                seq_finals = final_values[seq_mask]
-                seq_baselines = baselines[seq_mask]
-                
-                if len(seq_finals) > 0:
-                    sequence_performance[seq_idx] = {
-                        'start_year': complete_sequences[seq_idx]['start_year'],
-                        'end_year': complete_sequences[seq_idx]['end_year'],
-                        'avg_final': np.mean(seq_finals),
-                        'median_final': np.median(seq_finals),
-                        'p10': np.percentile(seq_finals, 10),
-                        'p25': np.percentile(seq_finals, 25),
-                        'p75': np.percentile(seq_finals, 75),
-                        'p90': np.percentile(seq_finals, 90),
-                        'avg_baseline': np.mean(seq_baselines),
-                        'beat_baseline_pct': np.sum(seq_finals > seq_baselines) / len(seq_finals) * 100
-                    }
-            
-            # Sort by median final value (not average)
-            sorted_sequences = sorted(sequence_performance.items(), key=lambda x: x[1]['median_final'], reverse=True)
-            
-            # Top 3 performing sequences
-            st.markdown("**Top 3 Best Performing Sequences:**")
-            top3_data = []
-            for seq_idx, perf in sorted_sequences[:3]:
-                top3_data.append({
-                    'Period': f"{perf['start_year']}-{perf['end_year']}",
-                    'Baseline': f"${perf['avg_baseline']:,.0f}",
-                    'Median Final': f"${perf['median_final']:,.0f}",
-                    '10th %ile': f"${perf['p10']:,.0f}",
-                    '90th %ile': f"${perf['p90']:,.0f}",
-                    'vs Baseline': f"+${perf['median_final'] - perf['avg_baseline']:,.0f}",
-                    'Beat %': f"{perf['beat_baseline_pct']:.1f}%"
-                })
-            st.dataframe(pd.DataFrame(top3_data), use_container_width=True)
-            
-            # Bottom 3 performing sequences
-            st.markdown("**Top 3 Worst Performing Sequences:**")
-            bottom3_data = []
-            for seq_idx, perf in sorted_sequences[-3:]:
-                bottom3_data.append({
-                    'Period': f"{perf['start_year']}-{perf['end_year']}",
-                    'Baseline': f"${perf['avg_baseline']:,.0f}",
-                    'Median Final': f"${perf['median_final']:,.0f}",
-                    '10th %ile': f"${perf['p10']:,.0f}",
-                    '90th %ile': f"${perf['p90']:,.0f}",
-                    'vs Baseline': f"+${perf['median_final'] - perf['avg_baseline']:,.0f}",
-                    'Beat %': f"{perf['beat_baseline_pct']:.1f}%"
-                })
-            st.dataframe(pd.DataFrame(bottom3_data), use_container_width=True)
+    render_sequence_analysis(results, sequence_tables)
     
     # Detailed statistics for each portfolio
     st.markdown("### Detailed Portfolio Statistics")
     
     tabs = st.tabs([result_data['name'] for result_data in results.values()])
     
-    HYSA_monthly_returns = calculate_monthly_return(hysa_apy, 0)[0]
-    
     for tab, (port_id, result_data) in zip(tabs, results.items()):
         with tab:
-            data = result_data['data']
-            final_values = data['final_values']
-            baselines = data['baselines']
-            
-            # Calculate IRR
-            with st.spinner("Calculating IRR..."):
-                irr_data = calculate_all_irrs(
-                    result_data['results'],
-                    contribution_func,
-                    HYSA_monthly_returns
-                )
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("**Portfolio Statistics**")
-                st.write(f"Mean IRR: {np.mean(irr_data['irr_returns']):.2f}%")
-                st.write(f"Median IRR: {np.median(irr_data['irr_returns']):.2f}%")
-                st.write(f"Std Dev IRR: {np.std(irr_data['irr_returns']):.2f}%")
-                st.write(f"Min IRR: {np.min(irr_data['irr_returns']):.2f}%")
-                st.write(f"Max IRR: {np.max(irr_data['irr_returns']):.2f}%")
-            
-            with col2:
-                st.markdown("**Baseline Comparison**")
-                st.write(f"Baseline IRR: {np.mean(irr_data['baseline_irr_returns']):.2f}%")
-                st.write(f"IRR Advantage: {np.mean(irr_data['irr_returns']) - np.mean(irr_data['baseline_irr_returns']):.2f}%")
-                beat_pct = np.sum(final_values > baselines) / len(final_values) * 100
-                st.write(f"Beat Baseline: {beat_pct:.2f}%")
-                st.write(f"Median Gain: ${np.median(final_values - baselines):,.0f}")
-            
+            render_portfolio_statistics(port_id, result_data, contribution_schedule, HYSA_monthly_returns)
 
 # Footer
 st.markdown("---")
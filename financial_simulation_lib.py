@@ -5,7 +5,8 @@ Contains all core functions for running investment simulations
 """
 
 import numpy as np
-from scipy.optimize import newton
+from numba import njit, prange
+from scipy.optimize import brentq, newton
 
 # Historical market returns data
 market_returns = {
@@ -65,297 +66,578 @@ market_returns = {
     }
 }
 
+# Asset series tracked per simulation (Baseline is kept separately)
+ASSET_KEYS = ['SP500', 'NASDAQ100', 'TBILL_3M', 'HYSA', 'Emergency_fund']
 
-def calculate_irr(cash_flows, times):
+# Rows of the (n_sims, 6, n_months) path block returned by run_investment_simulation
+PATH_KEYS = ASSET_KEYS + ['Baseline']
+BASELINE_ROW = len(ASSET_KEYS)
+
+
+def calculate_irr(cash_flows, times, guess=None):
     """
     Calculate Internal Rate of Return (IRR) given cash flows and their timing.
+
+    Outflows followed by a final payoff give an NPV that is monotonic in the
+    rate, so a sign change on a coarse rate grid brackets the IRR and Brent's
+    method finds it without Newton's risk of diverging. Newton is only used
+    when no bracket is found.
+
+    Parameters:
+    -----------
+    guess : float, optional
+        Rate expected to be close to the IRR (e.g. a similar simulation's IRR);
+        it is added to the grid to tighten the bracket
     """
+    cash_flows = np.asarray(cash_flows, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+
     def npv(rate):
-        return sum(cf / (1 + rate) ** t for cf, t in zip(cash_flows, times))
+        return np.dot(cash_flows, (1 + rate) ** -times)
 
     def npv_derivative(rate):
-        return sum(-t * cf / (1 + rate) ** (t + 1) for cf, t in zip(cash_flows, times))
+        return -np.dot(times * cash_flows, (1 + rate) ** -(times + 1))
 
+    rates = np.array([-0.99, -0.5, -0.2, 0.0, 0.2, 1.0])
+    if guess is not None and np.isfinite(guess) and rates[0] < guess < rates[-1]:
+        rates = np.sort(np.append(rates, guess))
+    npvs = ((1 + rates)[:, None] ** -times) @ cash_flows
+
+    sign_changes = np.flatnonzero(np.sign(npvs[:-1]) != np.sign(npvs[1:]))
     try:
-        irr = newton(npv, 0.05, fprime=npv_derivative, maxiter=100)
+        if len(sign_changes) > 0:
+            i = sign_changes[0]
+            return brentq(npv, rates[i], rates[i + 1], xtol=1e-6, maxiter=50)
+        irr = newton(npv, 0.05 if guess is None else guess, fprime=npv_derivative, maxiter=100)
         return irr
     except:
         return np.nan
 
 
+@njit(cache=True)
+def _irr_newton(cash_flows, times, guess, tol, maxiter, out):
+    """
+    Solve every row of cash_flows for its IRR with Newton's method.
+
+    Each step walks the flows once, accumulating the NPV and its derivative.
+    Discount factors follow the recurrence v_j = v_{j-1} * (1+rate)**-(t_j - t_{j-1}),
+    so on the monthly grid only a couple of exp calls are needed per step
+    instead of one power per flow. Rows that diverge or do not converge within
+    maxiter are left NaN.
+
+    Kept serial: the app calls this from Streamlit's script thread, where a
+    parallel Numba kernel keeps its worker pool alive past interpreter exit.
+    """
+    n_flows = len(times)
+    for i in range(cash_flows.shape[0]):
+        out[i] = np.nan
+        rate = guess
+        for _ in range(maxiter):
+            if not 1 + rate > 0:
+                break
+            log_growth = np.log1p(rate)
+            discount = np.exp(-times[0] * log_growth)
+            step = 0.0
+            step_discount = 1.0
+            npv = 0.0
+            weighted = 0.0
+            for j in range(n_flows):
+                if j > 0:
+                    dt = times[j] - times[j - 1]
+                    # Evenly spaced times reuse the previous step's factor
+                    if abs(dt - step) > 1e-12:
+                        step = dt
+                        step_discount = np.exp(-dt * log_growth)
+                    discount *= step_discount
+                discounted = cash_flows[i, j] * discount
+                npv += discounted
+                weighted += discounted * times[j]
+            npv_derivative = -weighted / (1 + rate)
+            if npv_derivative == 0:
+                break
+
+            new_rate = rate - npv / npv_derivative
+            if not np.isfinite(new_rate):
+                break
+            # Same stopping rule as scipy's newton: stop once the step is below tol
+            if abs(new_rate - rate) < tol:
+                out[i] = new_rate
+                break
+            rate = new_rate
+
+
+def calculate_irr_batch(cash_flows, times, guess=0.05, tol=1.48e-8, maxiter=100):
+    """
+    Calculate IRR for many cash flow series that share the same timing.
+
+    Every row of the (n_series, n_flows) cash_flows matrix is solved with
+    Newton's method in one compiled pass. Rows where Newton fails are
+    re-solved with calculate_irr's bracketed search, warm-started from the
+    median of the converged rates; rows that still fail are NaN.
+    """
+    cash_flows = np.ascontiguousarray(cash_flows, dtype=np.float64)
+    times = np.ascontiguousarray(times, dtype=np.float64)
+
+    irrs = np.empty(len(cash_flows))
+    _irr_newton(cash_flows, times, guess, tol, maxiter, irrs)
+
+    failed = np.flatnonzero(np.isnan(irrs))
+    if len(failed) > 0:
+        warm_start = np.median(irrs[np.isfinite(irrs)]) if len(failed) < len(irrs) else None
+        for idx in failed:
+            irrs[idx] = calculate_irr(cash_flows[idx], times, guess=warm_start)
+
+    return irrs
+
+
 def extract_simulation_data(simulation_results):
     """
     Extract key data arrays from simulation results.
+
+    All asset series form one (n_iter, n_assets, n_recorded) block (in ASSET_KEYS
+    order) so totals and percentiles can be computed with single vectorized
+    calls; asset_values holds per-asset views into it. The block is a view of
+    the simulation's path block, so no asset series is copied.
+
+    'totals' is the (n_iter, n_recorded) portfolio value (all assets incl.
+    emergency fund) with one column per month in the simulation's
+    'month_index': every month with return_trajectories, otherwise yearly.
     """
-    final_values = []
-    all_timeseries = []
-    baselines = []
-    sequence_indices = []
-
-    for i, result_dict in enumerate(simulation_results['result_dict']):
-        final_total = (result_dict['SP500'][-1] +
-                       result_dict['NASDAQ100'][-1] +
-                       result_dict['TBILL_3M'][-1] +
-                       result_dict['HYSA'][-1] +
-                       result_dict['Emergency_fund'][-1])
-        final_values.append(final_total)
-        baselines.append(result_dict['Baseline'][-1])
-        sequence_indices.append(simulation_results['sequence_index'][i])
-
-        timeseries = []
-        for j in range(len(result_dict['Month_Index'])):
-            total = (result_dict['SP500'][j] +
-                     result_dict['NASDAQ100'][j] +
-                     result_dict['TBILL_3M'][j] +
-                     result_dict['HYSA'][j] +
-                     result_dict['Emergency_fund'][j])
-            timeseries.append(total)
-        all_timeseries.append(timeseries)
+    paths = simulation_results['paths']
+    n_iter = len(paths)
+
+    # The asset rows of the path block already have the stacked layout
+    asset_block = paths[:, :BASELINE_ROW, :]
+
+    asset_values = {asset: asset_block[:, asset_idx, :] for asset_idx, asset in enumerate(ASSET_KEYS)}
+
+    totals = asset_block.sum(axis=1)
+
+    # Per-iteration outcomes share one (2, n_iter) buffer at the block's precision
+    # (float32 by default); final_values and baselines are its contiguous rows
+    outcomes = np.empty((2, n_iter), dtype=asset_block.dtype)
+    outcomes[0] = totals[:, -1]
+    outcomes[1] = paths[:, BASELINE_ROW, -1]
+    final_values, baselines = outcomes
+
+    # Summary statistics read by the results display
+    p10, p25, p50, p75, p90 = np.percentile(final_values, [10, 25, 50, 75, 90])
+    summary = {
+        'mean': np.mean(final_values),
+        'median': p50,
+        'p10': p10,
+        'p25': p25,
+        'p50': p50,
+        'p75': p75,
+        'p90': p90,
+        'std': np.std(final_values),
+        'avg_baseline': np.mean(baselines),
+        'beat_baseline_pct': np.mean(final_values > baselines) * 100,
+        'median_gain': np.median(final_values - baselines)
+    }
 
     return {
-        'final_values': np.array(final_values),
-        'baselines': np.array(baselines),
-        'all_timeseries': all_timeseries,
-        'sequence_indices': np.array(sequence_indices)
+        'final_values': final_values,
+        'baselines': baselines,
+        'outcomes': outcomes,
+        'summary': summary,
+        'totals': totals,
+        'asset_block': asset_block,
+        'asset_values': asset_values,
+        'sequence_indices': np.asarray(simulation_results['sequence_index'], dtype=np.int32)
     }
 
 
-def calculate_all_irrs(simulation_results, contribution_function, HYSA_monthly_returns):
+def month_column(simulation_results, months):
     """
-    Calculate IRR for all simulations (both portfolio and baseline).
-    
+    Get the path block column(s) holding the values recorded at the given month(s).
+
+    Raises ValueError for months the simulation did not record (without
+    return_trajectories only every 12th month is kept).
+    """
+    month_index = simulation_results['month_index']
+    columns = np.searchsorted(month_index, months)
+    if np.any(columns >= len(month_index)) or np.any(month_index[np.minimum(columns, len(month_index) - 1)] != months):
+        raise ValueError(f"Month(s) {months} not recorded; run the simulation with return_trajectories=True")
+    return columns
+
+
+def investment_totals(data):
+    """
+    Get the invested value (SP500, NASDAQ100, TBILL_3M, HYSA) for every iteration and recorded month.
+    """
+    return data['asset_block'][:, :4, :].sum(axis=1)
+
+
+def summarize_results(simulation_results, milestone_years, investment_mix=None,
+                      contribution_function=None):
+    """
+    Compute the display statistics for one simulation from its stacked totals.
+
+    Extends extract_simulation_data's result with 'milestones' ({year: milestone
+    statistics}), read from the same totals instead of re-summing the assets per
+    milestone, and with 'fund_returns' when investment_mix and
+    contribution_function are given.
+
     Parameters:
     -----------
-    contribution_function : callable
-        Function that takes month number and returns contribution amount
-    """
-    irr_returns = []
-    baseline_irr_returns = []
-
-    for idx, result_dict in enumerate(simulation_results['result_dict']):
-        # Build cash flow list for portfolio
-        cash_flows = []
-        times = []
-
-        initial = (result_dict['SP500'][0] +
-                  result_dict['NASDAQ100'][0] +
-                  result_dict['TBILL_3M'][0] +
-                  result_dict['HYSA'][0] +
-                  result_dict['Emergency_fund'][0])
-        cash_flows.append(-initial)
-        times.append(0)
-
-        total_months = len(result_dict['Month_Index']) - 1
-        for month_idx in range(1, total_months + 1):
-            month = month_idx - 1
-            contribution = contribution_function(month)
-            cash_flows.append(-contribution)
-            times.append(month_idx / 12)
-
-        final = (result_dict['SP500'][-1] +
-                result_dict['NASDAQ100'][-1] +
-                result_dict['TBILL_3M'][-1] +
-                result_dict['HYSA'][-1] +
-                result_dict['Emergency_fund'][-1])
-        cash_flows.append(final)
-        times.append(15)
-
-        irr = calculate_irr(cash_flows, times)
-        if not np.isnan(irr):
-            irr_returns.append(irr * 100)
-
-        # Build cash flow list for baseline
-        baseline_cash_flows = []
-        baseline_times = []
-
-        baseline_initial = result_dict['Baseline'][0]
-        baseline_cash_flows.append(-baseline_initial)
-        baseline_times.append(0)
-
-        for month_idx in range(1, total_months + 1):
-            prev_baseline = result_dict['Baseline'][month_idx - 1]
-            curr_baseline = result_dict['Baseline'][month_idx]
-            baseline_contribution = (curr_baseline / (1 + HYSA_monthly_returns)) - prev_baseline
-            baseline_cash_flows.append(-baseline_contribution)
-            baseline_times.append(month_idx / 12)
-
-        baseline_final = result_dict['Baseline'][-1]
-        baseline_cash_flows.append(baseline_final)
-        baseline_times.append(15)
-
-        baseline_irr = calculate_irr(baseline_cash_flows, baseline_times)
-        if not np.isnan(baseline_irr):
-            baseline_irr_returns.append(baseline_irr * 100)
+    milestone_years : list of int
+        Years (multiples of 12 months) to summarize
+    """
+    data = extract_simulation_data(simulation_results)
+    baseline_series = simulation_results['paths'][:, BASELINE_ROW, :]
+
+    data['milestones'] = {}
+    for year in milestone_years:
+        column = month_column(simulation_results, year * 12)
+        data['milestones'][year] = _milestone_statistics(data['totals'][:, column], baseline_series[:, column])
+    if investment_mix is not None and contribution_function is not None:
+        data['fund_returns'] = calculate_fund_returns(simulation_results, contribution_function, investment_mix)
+
+    return data
+
+
+def calculate_sequence_statistics(data, n_sequences):
+    """
+    Calculate final-value statistics for each historical sequence in one pass.
+
+    Simulations are grouped by sequence with a single stable sort; when every
+    sequence has the same number of iterations (the normal case) the groups are
+    reshaped into an (n_sequences, k) block and reduced along axis 1.
+
+    Returns a dict of arrays indexed alongside 'sequence', which lists the
+    sequences that have at least one simulation.
+    """
+    sequence_indices = data['sequence_indices']
+
+    # One gather reorders final values and baselines together
+    order = np.argsort(sequence_indices, kind='stable')
+    fv_sorted, bl_sorted = data['outcomes'][:, order]
+
+    counts = np.bincount(sequence_indices, minlength=n_sequences)
+    present = np.flatnonzero(counts)
+    counts = counts[present]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    if np.all(counts == counts[0]):
+        block = fv_sorted.reshape(len(present), counts[0])
+        p10, p25, p50, p75, p90 = np.percentile(block, [10, 25, 50, 75, 90], axis=1)
+    else:
+        groups = np.split(fv_sorted, starts[1:])
+        p10, p25, p50, p75, p90 = np.array([np.percentile(group, [10, 25, 50, 75, 90])
+                                            for group in groups]).T
+
+    beat_counts = np.add.reduceat((fv_sorted > bl_sorted).astype(np.int32), starts)
 
     return {
-        'irr_returns': np.array(irr_returns),
-        'baseline_irr_returns': np.array(baseline_irr_returns)
+        'sequence': present,
+        'avg_final': np.add.reduceat(fv_sorted, starts) / counts,
+        'median_final': p50,
+        'p10': p10,
+        'p25': p25,
+        'p75': p75,
+        'p90': p90,
+        'avg_baseline': np.add.reduceat(bl_sorted, starts) / counts,
+        'beat_baseline_pct': beat_counts / counts * 100
     }
 
 
-def calculate_milestone_statistics(simulation_results, year):
+def calculate_all_irrs(simulation_results, contribution_function, HYSA_monthly_returns):
     """
-    Calculate statistics at a specific year milestone.
+    Calculate IRR for all simulations (both portfolio and baseline).
+    
+    Parameters:
+    -----------
+    contribution_function : callable or array-like
+        Function that takes month number and returns contribution amount,
+        or a precomputed array of contributions indexed by month
+    HYSA_monthly_returns : float
+        Monthly HYSA rate of the run; the baseline's growth is already in its
+        simulated path, so the calculation itself does not need it
     """
-    month_index = year * 12
+    paths = simulation_results['paths']
+    total_months = simulation_results['month_index'][-1]
+    n_flows = total_months + 2
+
+    # Initial value at t=0, monthly contributions, final value at 15 years
+    times = np.concatenate(([0.0], np.arange(1, total_months + 1) / 12, [15.0]))
+    contributions = get_contribution_schedule(contribution_function, total_months)[:total_months]
+
+    # Portfolio cash flows; only the start and end values are read, so paths
+    # need not hold every month
+    assets = paths[:, :BASELINE_ROW, :]
+    cash_flows = np.empty((len(paths), n_flows))
+    cash_flows[:, 0] = -assets[:, :, 0].sum(axis=1)
+    cash_flows[:, 1:-1] = -contributions
+    cash_flows[:, -1] = assets[:, :, -1].sum(axis=1)
+
+    # The baseline grows at the fixed HYSA rate with the same contributions, so
+    # every path has the same baseline cash flows and one solve covers them all.
+    # (Its IRR is close to, but not exactly, the HYSA APY: flows are dated at the
+    # start of the month after they are invested, as for the portfolio.)
+    baseline_cash_flows = np.empty((1, n_flows))
+    baseline_cash_flows[0, 0] = -paths[0, BASELINE_ROW, 0]
+    baseline_cash_flows[0, 1:-1] = -contributions
+    baseline_cash_flows[0, -1] = paths[0, BASELINE_ROW, -1]
+
+    irrs = calculate_irr_batch(cash_flows, times)
+    baseline_irrs = np.full(len(paths), calculate_irr_batch(baseline_cash_flows, times)[0])
 
-    milestone_values = []
-    milestone_baselines = []
+    return {
+        'irr_returns': irrs[~np.isnan(irrs)] * 100,
+        'baseline_irr_returns': baseline_irrs[~np.isnan(baseline_irrs)] * 100
+    }
 
-    for result_dict in simulation_results['result_dict']:
-        if len(result_dict['Month_Index']) > month_index:
-            total = (result_dict['SP500'][month_index] +
-                    result_dict['NASDAQ100'][month_index] +
-                    result_dict['TBILL_3M'][month_index] +
-                    result_dict['HYSA'][month_index] +
-                    result_dict['Emergency_fund'][month_index])
-            milestone_values.append(total)
-            milestone_baselines.append(result_dict['Baseline'][month_index])
 
-    milestone_values = np.array(milestone_values)
-    milestone_baselines = np.array(milestone_baselines)
+def _milestone_statistics(milestone_values, milestone_baselines):
+    """
+    Summarize portfolio totals and baselines at one milestone month.
+    """
+    p25, p50, p75 = np.percentile(milestone_values, [25, 50, 75])
+    avg_baseline = np.mean(milestone_baselines)
 
     return {
-        'p25': np.percentile(milestone_values, 25),
-        'p50': np.percentile(milestone_values, 50),
-        'p75': np.percentile(milestone_values, 75),
-        'avg_baseline': np.mean(milestone_baselines),
-        'beat_baseline_pct': np.sum(milestone_values > milestone_baselines) / len(milestone_values) * 100,
-        'median_gain': np.percentile(milestone_values, 50) - np.mean(milestone_baselines)
+        'p25': p25,
+        'p50': p50,
+        'p75': p75,
+        'avg_baseline': avg_baseline,
+        'beat_baseline_pct': np.mean(milestone_values > milestone_baselines) * 100,
+        'median_gain': p50 - avg_baseline
     }
 
 
+def calculate_milestone_statistics(simulation_results, year):
+    """
+    Calculate statistics at a specific year milestone.
+    """
+    column = month_column(simulation_results, year * 12)
+    paths = simulation_results['paths']
+    return _milestone_statistics(paths[:, :BASELINE_ROW, column].sum(axis=1),
+                                 paths[:, BASELINE_ROW, column])
+
+
 def calculate_fund_returns(simulation_results, contribution_function, investment_mix):
     """
     Calculate annualized returns for each individual fund.
     
     Parameters:
     -----------
-    contribution_function : callable
-        Function that takes month number and returns contribution amount
-    """
-    sp500_returns = []
-    nasdaq_returns = []
-    tbill_returns = []
-    hysa_returns = []
-    emergency_returns = []
-
-    for idx, result_dict in enumerate(simulation_results['result_dict']):
-        total_months = len(result_dict['Month_Index']) - 1
-        total_contribution = 0
-        for month in range(total_months):
-            total_contribution += contribution_function(month)
-
-        # S&P 500
-        sp500_initial = result_dict['SP500'][0]
-        sp500_final = result_dict['SP500'][-1]
-        sp500_contributions = total_contribution * investment_mix['SP500']
-        sp500_total_invested = sp500_initial + sp500_contributions
-        if sp500_total_invested > 0:
-            sp500_return = ((sp500_final / sp500_total_invested) ** (1/15) - 1) * 100
-            sp500_returns.append(sp500_return)
-
-        # NASDAQ 100
-        nasdaq_initial = result_dict['NASDAQ100'][0]
-        nasdaq_final = result_dict['NASDAQ100'][-1]
-        nasdaq_contributions = total_contribution * investment_mix['NASDAQ']
-        nasdaq_total_invested = nasdaq_initial + nasdaq_contributions
-        if nasdaq_total_invested > 0:
-            nasdaq_return = ((nasdaq_final / nasdaq_total_invested) ** (1/15) - 1) * 100
-            nasdaq_returns.append(nasdaq_return)
-
-        # T-Bills
-        tbill_initial = result_dict['TBILL_3M'][0]
-        tbill_final = result_dict['TBILL_3M'][-1]
-        tbill_contributions = total_contribution * investment_mix['TBill']
-        tbill_total_invested = tbill_initial + tbill_contributions
-        if tbill_total_invested > 0:
-            tbill_return = ((tbill_final / tbill_total_invested) ** (1/15) - 1) * 100
-            tbill_returns.append(tbill_return)
-
-        # HYSA
-        hysa_initial = result_dict['HYSA'][0]
-        hysa_final = result_dict['HYSA'][-1]
-        hysa_contributions = total_contribution * investment_mix['HYSA']
-        hysa_total_invested = hysa_initial + hysa_contributions
-        if hysa_total_invested > 0:
-            hysa_return = ((hysa_final / hysa_total_invested) ** (1/15) - 1) * 100
-            hysa_returns.append(hysa_return)
-
-        # Emergency Fund
-        emergency_initial = result_dict['Emergency_fund'][0]
-        emergency_final = result_dict['Emergency_fund'][-1]
-        if emergency_initial > 0:
-            emergency_return = ((emergency_final / emergency_initial) ** (1/15) - 1) * 100
-            emergency_returns.append(emergency_return)
+    contribution_function : callable or array-like
+        Function that takes month number and returns contribution amount,
+        or a precomputed array of contributions indexed by month
+    """
+    paths = simulation_results['paths']
 
-    return {
-        'SP500': np.array(sp500_returns),
-        'NASDAQ100': np.array(nasdaq_returns),
-        'TBILL_3M': np.array(tbill_returns),
-        'HYSA': np.array(hysa_returns),
-        'Emergency_fund': np.array(emergency_returns)
-    }
+    # Contributions are the same for every path
+    total_months = simulation_results['month_index'][-1]
+    total_contribution = get_contribution_schedule(contribution_function, total_months)[:total_months].sum()
+
+    # Invested funds: starting value plus their share of contributions
+    fund_returns = {}
+    for asset, mix_key in [('SP500', 'SP500'), ('NASDAQ100', 'NASDAQ'), ('TBILL_3M', 'TBill'), ('HYSA', 'HYSA')]:
+        row = PATH_KEYS.index(asset)
+        total_invested = paths[:, row, 0] + total_contribution * investment_mix[mix_key]
+        invested = total_invested > 0
+        fund_returns[asset] = ((paths[invested, row, -1] / total_invested[invested]) ** (1/15) - 1) * 100
+
+    # Emergency Fund (no contributions)
+    row = PATH_KEYS.index('Emergency_fund')
+    emergency_initial = paths[:, row, 0]
+    funded = emergency_initial > 0
+    fund_returns['Emergency_fund'] = ((paths[funded, row, -1] / emergency_initial[funded]) ** (1/15) - 1) * 100
+
+    return fund_returns
+
+
+def calculate_monthly_rate(yearly_return):
+    """
+    Get the constant monthly return that compounds to the annual return.
+    """
+    return (1 + yearly_return)**(1/12) - 1
 
 
 def calculate_monthly_return(yearly_return, std):
     """
     Get the monthly return from the annual return with noise for realism.
     """
-    avg_monthly_return = (1 + yearly_return)**(1/12) - 1
-    actual_monthly_return = []
-    for i in range(0, 12):
-        actual_return = avg_monthly_return + np.random.normal(0, std)
-        actual_monthly_return.append(actual_return)
-    return actual_monthly_return
+    avg_monthly_return = calculate_monthly_rate(yearly_return)
+    if std == 0:
+        # Deterministic (e.g. HYSA): no noise to draw
+        return np.full(12, avg_monthly_return)
+    return avg_monthly_return + np.random.normal(0, std, 12)
 
 
 def get_15_year_sequences(market_returns):
     """
     Get all unique 15-year sequences from the market returns data.
+
+    Each asset's returns are laid out once as a year-indexed array (NaN for
+    missing years), so every sequence is a stride-1 view into it; assets without
+    all 15 years of data are None.
     """
     sequences = []
+    assets = ['SP500', 'NASDAQ100', 'TBILL_3M']
 
-    sp500_years = sorted(market_returns['SP500'].keys())
-    nasdaq_years = sorted(market_returns['NASDAQ100'].keys())
-    tbill_years = sorted(market_returns['TBILL_3M'].keys())
+    earliest_year = min(min(market_returns[asset]) for asset in assets)
+    latest_year = max(max(market_returns[asset]) for asset in assets)
 
-    earliest_year = min(sp500_years[0], nasdaq_years[0], tbill_years[0])
-    latest_year = max(sp500_years[-1], nasdaq_years[-1], tbill_years[-1])
+    returns_by_year = {
+        asset: np.array([market_returns[asset].get(year, np.nan)
+                         for year in range(earliest_year, latest_year + 1)])
+        for asset in assets
+    }
 
-    for start_year in range(earliest_year, latest_year - 14):
-        end_year = start_year + 14
+    for offset in range(latest_year - earliest_year - 14):
+        start_year = earliest_year + offset
 
         sequence = {
             'start_year': start_year,
-            'end_year': end_year,
-            'SP500': [],
-            'NASDAQ100': [],
-            'TBILL_3M': []
+            'end_year': start_year + 14
         }
+        for asset in assets:
+            returns = returns_by_year[asset][offset:offset + 15]
+            sequence[asset] = None if np.isnan(returns).any() else returns
 
-        has_sp500 = all(year in sp500_years for year in range(start_year, end_year + 1))
-        has_nasdaq = all(year in nasdaq_years for year in range(start_year, end_year + 1))
-        has_tbill = all(year in tbill_years for year in range(start_year, end_year + 1))
+        sequences.append(sequence)
 
-        if has_sp500:
-            sequence['SP500'] = [market_returns['SP500'][year] for year in range(start_year, end_year + 1)]
-        else:
-            sequence['SP500'] = None
+    return sequences
 
-        if has_nasdaq:
-            sequence['NASDAQ100'] = [market_returns['NASDAQ100'][year] for year in range(start_year, end_year + 1)]
-        else:
-            sequence['NASDAQ100'] = None
 
-        if has_tbill:
-            sequence['TBILL_3M'] = [market_returns['TBILL_3M'][year] for year in range(start_year, end_year + 1)]
-        else:
-            sequence['TBILL_3M'] = None
+def get_contribution_schedule(contribution_function, total_months=180):
+    """
+    Get the monthly contribution amounts as a float64 array indexed by month.
 
-        sequences.append(sequence)
+    Parameters:
+    -----------
+    contribution_function : callable or array-like
+        Function that takes month number and returns contribution amount,
+        or a precomputed array of contributions indexed by month
+    """
+    if callable(contribution_function):
+        return np.array([contribution_function(month) for month in range(total_months)], dtype=np.float64)
+    return np.asarray(contribution_function, dtype=np.float64)
+
+
+@njit(cache=True)
+def contribution_at(month, schedule):
+    """
+    Get the contribution for a month from a precomputed schedule.
+    """
+    return schedule[month]
 
-    return sequences
+
+@njit(cache=True)
+def _rebalance_mix(invested, target_mix, rebalancing_threshold, current_mix):
+    """
+    Update current_mix in place if the invested allocation drifted past the threshold.
+
+    invested holds the SP500, NASDAQ100, TBILL_3M and HYSA balances.
+    Contributions are steered toward under-weighted assets and away from
+    over-weighted ones; the portfolio itself is never traded.
+    """
+    total_value = invested[0] + invested[1] + invested[2] + invested[3]
+    if total_value <= 0:
+        return
+
+    # Check if any asset is >threshold off target
+    needs_rebalancing = False
+    for asset in range(4):
+        if abs(invested[asset] / total_value - target_mix[asset]) > rebalancing_threshold:
+            needs_rebalancing = True
+            break
+
+    if needs_rebalancing:
+        # Allocate more to under-weighted assets and less to over-weighted assets
+        total_adjustment = 0.0
+        for asset in range(4):
+            total_adjustment += max(0.0, target_mix[asset] - invested[asset] / total_value)
+
+        if total_adjustment > 0:
+            total_mix = 0.0
+            for asset in range(4):
+                adjustment = target_mix[asset] - invested[asset] / total_value
+                current_mix[asset] = target_mix[asset] + (adjustment / total_adjustment) * 0.5
+                total_mix += current_mix[asset]
+
+            # Ensure sum to 1.0
+            if total_mix > 0:
+                for asset in range(4):
+                    current_mix[asset] = current_mix[asset] / total_mix
+
+
+@njit(cache=True)
+def _simulate_path(sp500_returns, nasdaq_returns, tbill_returns, hysa_monthly_return,
+                   schedule, target_mix, enable_rebalancing, rebalancing_threshold,
+                   record_months, out):
+    """
+    Simulate one investment path month by month.
+
+    out has shape (6, len(record_months)) with rows SP500, NASDAQ100, TBILL_3M,
+    HYSA, Emergency_fund and Baseline; column j receives the balances after
+    month record_months[j]. record_months must be increasing and start at 0,
+    whose column must hold the starting values.
+    target_mix holds the SP500, NASDAQ, TBill and HYSA fractions.
+    """
+    current_mix = target_mix.copy()
+    invested = np.empty(4)
+    n_months = len(sp500_returns)
+    hysa_growth = 1 + hysa_monthly_return
+    record = 1
+
+    # Running balances are kept in float64 locals whatever out's dtype; out only
+    # receives the recorded months' values
+    sp500 = np.float64(out[0, 0])
+    nasdaq = np.float64(out[1, 0])
+    tbill = np.float64(out[2, 0])
+    hysa = np.float64(out[3, 0])
+    emergency = np.float64(out[4, 0])
+    baseline = np.float64(out[5, 0])
+
+    # Step a quarter at a time; rebalancing is only checked between quarters
+    # (months 3, 6, 9, 12, 15, etc.) so the monthly updates stay tight
+    for quarter_start in range(0, n_months, 3):
+        if enable_rebalancing and quarter_start > 0:
+            invested[0] = sp500
+            invested[1] = nasdaq
+            invested[2] = tbill
+            invested[3] = hysa
+            _rebalance_mix(invested, target_mix, rebalancing_threshold, current_mix)
+
+        for month in range(quarter_start, min(quarter_start + 3, n_months)):
+            contribution = contribution_at(month, schedule)
+
+            sp500 = (sp500 + contribution * current_mix[0]) * (1 + sp500_returns[month])
+            nasdaq = (nasdaq + contribution * current_mix[1]) * (1 + nasdaq_returns[month])
+            tbill = (tbill + contribution * current_mix[2]) * (1 + tbill_returns[month])
+            hysa = (hysa + contribution * current_mix[3]) * hysa_growth
+            emergency = emergency * hysa_growth
+            baseline = (baseline + contribution) * hysa_growth
+
+            if record < len(record_months) and record_months[record] == month + 1:
+                out[0, record] = sp500
+                out[1, record] = nasdaq
+                out[2, record] = tbill
+                out[3, record] = hysa
+                out[4, record] = emergency
+                out[5, record] = baseline
+                record += 1
+
+
+@njit(parallel=True, cache=True)
+def _simulate_paths(monthly_returns, hysa_monthly_return, schedule, target_mix,
+                    enable_rebalancing, rebalancing_threshold, start_values,
+                    record_months, out):
+    """
+    Simulate independent paths in parallel.
+
+    monthly_returns has shape (n_paths, 3, n_months) with SP500, NASDAQ100 and
+    TBILL_3M rows; each path p writes only its own out[p] slice.
+    """
+    for p in prange(monthly_returns.shape[0]):
+        out[p, :, 0] = start_values
+        _simulate_path(monthly_returns[p, 0], monthly_returns[p, 1], monthly_returns[p, 2],
+                       hysa_monthly_return, schedule, target_mix, enable_rebalancing,
+                       rebalancing_threshold, record_months, out[p])
 
 
 def run_investment_simulation(investment_mix, investment_start, emergency_fund_start,
@@ -364,139 +646,94 @@ def run_investment_simulation(investment_mix, investment_start, emergency_fund_s
                                contribution_function,
                                enable_rebalancing=False,
                                rebalancing_threshold=0.05,
-                               simulation_name="Investment Simulation"):
+                               simulation_name="Investment Simulation",
+                               dtype=np.float32,
+                               return_trajectories=False,
+                               seed=None):
     """
     Run a complete investment simulation with a given investment mix.
     
     Parameters:
     -----------
-    contribution_function : callable
-        Function that takes month number and returns contribution amount
+    contribution_function : callable or array-like
+        Function that takes month number and returns contribution amount,
+        or a precomputed array of contributions indexed by month
     enable_rebalancing : bool
         If True, rebalance contribution allocations quarterly to maintain target mix
     rebalancing_threshold : float
         Decimal threshold for triggering rebalancing (e.g., 0.05 for 5%)
+    dtype : numpy dtype
+        Storage type of the path block. float32 keeps ~7 significant digits
+        (about $1 on a $1M balance), which is plenty for the aggregate
+        statistics and halves the memory traffic of every reduction; balances
+        are still accumulated in float64 inside the kernel
+    return_trajectories : bool
+        If True, record every month (needed for plots over time); otherwise only
+        the start of each year and the final month are kept, which is all the
+        milestone, final-value, fund return and IRR statistics read
+    seed : int or np.random.SeedSequence, optional
+        Seed for the simulation's own PCG64 generator; runs with the same seed
+        are identical, and None draws fresh entropy
+
+    Returns:
+    --------
+    dict : 'paths' holds every simulation as an (n_sims, 6, n_recorded) array with
+           rows in PATH_KEYS order and one column per month in 'month_index';
+           'iteration', 'sequence_index', 'sequence_start_year' and
+           'sequence_end_year' are per-simulation arrays
     """
+    total_months = 15 * 12
+    n_sims = len(complete_sequences) * total_iterations
+    month_index = np.arange(0, total_months + 1, 1 if return_trajectories else 12)
+
+    # Every path is written straight into one (n_sims, 6, n_recorded) block with
+    # rows in PATH_KEYS order; months in between are never stored
+    paths = np.empty((n_sims, len(PATH_KEYS), len(month_index)), dtype=dtype)
+    sequence_index = np.repeat(np.arange(len(complete_sequences)), total_iterations)
     simulation_results = {
-        'iteration': [],
-        'sequence_index': [],
-        'sequence_start_year': [],
-        'sequence_end_year': [],
-        'result_dict': [],
+        'paths': paths,
+        'month_index': month_index,
+        'iteration': np.tile(np.arange(total_iterations), len(complete_sequences)),
+        'sequence_index': sequence_index,
+        'sequence_start_year': np.array([seq['start_year'] for seq in complete_sequences])[sequence_index],
+        'sequence_end_year': np.array([seq['end_year'] for seq in complete_sequences])[sequence_index],
         'simulation_name': simulation_name,
         'investment_mix': investment_mix
     }
 
-    HYSA_monthly_returns = calculate_monthly_return(hysa_apy, 0)[0]
-    
-    # Store target allocation
-    target_mix = {
-        'SP500': investment_mix['SP500'],
-        'NASDAQ': investment_mix['NASDAQ'],
-        'TBill': investment_mix['TBill'],
-        'HYSA': investment_mix['HYSA']
-    }
+    schedule = get_contribution_schedule(contribution_function, total_months)
 
-    for seq_idx, seq in enumerate(complete_sequences):
-        for iteration in range(0, total_iterations):
-            investment_breakdown = {
-                'Month_Index': [0],
-                'SP500': [investment_start * investment_mix['SP500']],
-                'NASDAQ100': [investment_start * investment_mix['NASDAQ']],
-                'TBILL_3M': [investment_start * investment_mix['TBill']],
-                'HYSA': [investment_start * investment_mix['HYSA']],
-                'Emergency_fund': [emergency_fund_start],
-                'Baseline': [investment_start + emergency_fund_start]
-            }
-            
-            # Current contribution allocation (starts at target)
-            current_mix = target_mix.copy()
-
-            for year_idx in range(15):
-                sp500_monthly_returns = calculate_monthly_return(seq['SP500'][year_idx]/100, SP500_std)
-                nasdaq_monthly_returns = calculate_monthly_return(seq['NASDAQ100'][year_idx]/100, NASDAQ_std)
-                TBILL_3M_monthly_returns = calculate_monthly_return(seq['TBILL_3M'][year_idx]/100, T_Bills_std)
-
-                for month_idx in range(12):
-                    current_month = investment_breakdown['Month_Index'][-1]
-                    
-                    # Check for quarterly rebalancing (months 3, 6, 9, 12, 15, etc.)
-                    if enable_rebalancing and current_month > 0 and current_month % 3 == 0:
-                        # Calculate current allocation percentages
-                        total_value = (investment_breakdown['SP500'][-1] +
-                                      investment_breakdown['NASDAQ100'][-1] +
-                                      investment_breakdown['TBILL_3M'][-1] +
-                                      investment_breakdown['HYSA'][-1])
-                        
-                        if total_value > 0:
-                            current_allocation = {
-                                'SP500': investment_breakdown['SP500'][-1] / total_value,
-                                'NASDAQ': investment_breakdown['NASDAQ100'][-1] / total_value,
-                                'TBill': investment_breakdown['TBILL_3M'][-1] / total_value,
-                                'HYSA': investment_breakdown['HYSA'][-1] / total_value
-                            }
-                            
-                            # Check if any asset is >threshold off target
-                            needs_rebalancing = False
-                            for asset in ['SP500', 'NASDAQ', 'TBill', 'HYSA']:
-                                diff = abs(current_allocation[asset] - target_mix[asset])
-                                if diff > rebalancing_threshold:
-                                    needs_rebalancing = True
-                                    break
-                            
-                            if needs_rebalancing:
-                                # Calculate adjustment: allocate more to under-weighted assets
-                                # and less to over-weighted assets
-                                adjustments = {}
-                                for asset in ['SP500', 'NASDAQ', 'TBill', 'HYSA']:
-                                    # Difference from target (positive = over-allocated)
-                                    diff = current_allocation[asset] - target_mix[asset]
-                                    # Invert: negative diff means we should allocate MORE
-                                    adjustments[asset] = -diff
-                                
-                                # Normalize adjustments to sum to 1.0
-                                total_adjustment = sum(max(0, adj) for adj in adjustments.values())
-                                if total_adjustment > 0:
-                                    current_mix = {}
-                                    for asset in ['SP500', 'NASDAQ', 'TBill', 'HYSA']:
-                                        # Assets that are under-allocated get more contribution
-                                        if adjustments[asset] > 0:
-                                            current_mix[asset] = target_mix[asset] + (adjustments[asset] / total_adjustment) * 0.5
-                                        else:
-                                            current_mix[asset] = target_mix[asset] + (adjustments[asset] / total_adjustment) * 0.5
-                                    
-                                    # Ensure sum to 1.0
-                                    total_mix = sum(current_mix.values())
-                                    if total_mix > 0:
-                                        for asset in current_mix:
-                                            current_mix[asset] = current_mix[asset] / total_mix
-                    
-                    contribution = contribution_function(current_month)
-
-                    sp500_contribution = contribution * current_mix['SP500']
-                    nasdaq_contribution = contribution * current_mix['NASDAQ']
-                    tbill_contribution = contribution * current_mix['TBill']
-                    hysa_contribution = contribution * current_mix['HYSA']
-
-                    investment_breakdown['Month_Index'].append(current_month + 1)
-
-                    new_sp500 = (investment_breakdown['SP500'][-1] + sp500_contribution) * (1 + sp500_monthly_returns[month_idx])
-                    new_nasdaq = (investment_breakdown['NASDAQ100'][-1] + nasdaq_contribution) * (1 + nasdaq_monthly_returns[month_idx])
-                    new_tbill = (investment_breakdown['TBILL_3M'][-1] + tbill_contribution) * (1 + TBILL_3M_monthly_returns[month_idx])
-                    new_hysa = (investment_breakdown['HYSA'][-1] + hysa_contribution) * (1 + HYSA_monthly_returns)
-                    new_baseline = (investment_breakdown['Baseline'][-1] + contribution) * (1 + HYSA_monthly_returns)
-
-                    investment_breakdown['SP500'].append(new_sp500)
-                    investment_breakdown['NASDAQ100'].append(new_nasdaq)
-                    investment_breakdown['TBILL_3M'].append(new_tbill)
-                    investment_breakdown['HYSA'].append(new_hysa)
-                    investment_breakdown['Emergency_fund'].append(investment_breakdown['Emergency_fund'][-1] * (1 + HYSA_monthly_returns))
-                    investment_breakdown['Baseline'].append(new_baseline)
-
-            simulation_results['iteration'].append(iteration)
-            simulation_results['sequence_index'].append(seq_idx)
-            simulation_results['sequence_start_year'].append(seq['start_year'])
-            simulation_results['sequence_end_year'].append(seq['end_year'])
-            simulation_results['result_dict'].append(investment_breakdown)
+    HYSA_monthly_returns = calculate_monthly_rate(hysa_apy)
+    
+    # Store target allocation (SP500, NASDAQ, TBill, HYSA)
+    target_mix = np.array([investment_mix['SP500'], investment_mix['NASDAQ'],
+                           investment_mix['TBill'], investment_mix['HYSA']])
+    start_values = np.array([investment_start * investment_mix['SP500'],
+                             investment_start * investment_mix['NASDAQ'],
+                             investment_start * investment_mix['TBill'],
+                             investment_start * investment_mix['HYSA'],
+                             emergency_fund_start,
+                             investment_start + emergency_fund_start])
+    # Monthly noise scale for SP500, NASDAQ100 and TBILL_3M
+    stds = np.array([SP500_std, NASDAQ_std, T_Bills_std])
+    rng = np.random.default_rng(seed)
+
+    # Average monthly return for each sequence, asset and year, shape (n_sequences, 3, 15)
+    sequence_monthly_returns = calculate_monthly_rate(
+        np.array([[seq['SP500'][:15], seq['NASDAQ100'][:15], seq['TBILL_3M'][:15]]
+                  for seq in complete_sequences]) / 100)
+
+    for seq_idx, avg_monthly_returns in enumerate(sequence_monthly_returns):
+
+        # Noise for all of this sequence's iterations is drawn in one batch, one path after
+        # another in (year, asset, month) order, so seeded runs do not depend on threading
+        noise = rng.standard_normal((total_iterations, 15, 3, 12)).transpose(0, 2, 1, 3)
+        monthly_returns = (avg_monthly_returns[None, :, :, None] + stds[None, :, None, None] * noise
+                           ).reshape(total_iterations, 3, total_months)
+
+        seq_paths = paths[seq_idx * total_iterations:(seq_idx + 1) * total_iterations]
+        _simulate_paths(monthly_returns, HYSA_monthly_returns, schedule, target_mix,
+                        enable_rebalancing, rebalancing_threshold, start_values,
+                        month_index, seq_paths)
 
     return simulation_results